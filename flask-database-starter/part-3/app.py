@@ -13,8 +13,12 @@ Prerequisites: Complete part-1 and part-2
 Install: pip install flask-sqlalchemy
 """
 
-from flask import Flask, render_template, request, redirect, url_for, flash
+import time
+from collections import Counter
+from flask import Flask, render_template, request, redirect, url_for, flash, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy  # Import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key'
@@ -28,6 +32,61 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # Disable warning
 db = SQLAlchemy(app)  # Initialize SQLAlchemy with app
 
 
+# =============================================================================
+# SQL INSTRUMENTATION (Server-Timing header)
+# =============================================================================
+# SQLAlchemy engine events count and time every statement a request runs.
+# The totals go into a response header that browser dev tools show under
+# Network > Timing:
+#   Server-Timing: db;dur=3.2;desc="4 queries", app;dur=9.8
+# The same statement running many times in one request is usually an N+1
+# loop (a relationship loaded inside a for loop) and is logged as a warning.
+
+app.config['SQL_TIMING_LOG'] = False  # True = log query count and time of every request
+SQL_REPEAT_WARNING = 5  # Same statement this many times in one request = probably N+1
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    stats = g.get('sql_stats') if has_request_context() else None  # Ignore startup and background work
+    if stats is not None:
+        stats['count'] += 1
+        stats['time'] += time.perf_counter() - conn.info['query_start']
+        if not executemany and statement.lstrip()[:6].upper() == 'SELECT':  # N+1 loops are repeated reads
+            stats['statements'][statement] += 1
+
+
+@app.before_request
+def start_sql_timing():
+    g.sql_stats = {'count': 0, 'time': 0.0, 'statements': Counter(), 'start': time.perf_counter()}
+
+
+@app.after_request
+def add_server_timing(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+
+    db_ms = stats['time'] * 1000
+    total_ms = (time.perf_counter() - stats['start']) * 1000
+    response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{stats["count"]} queries"')
+    response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+
+    for statement, times in stats['statements'].items():
+        if times >= SQL_REPEAT_WARNING:
+            app.logger.warning('Possible N+1 in %s %s: %d x %s',
+                               request.method, request.path, times, ' '.join(statement.split())[:200])
+    if app.config['SQL_TIMING_LOG']:
+        app.logger.info('%s %s: %d queries, %.1f ms SQL, %.1f ms total',
+                        request.method, request.path, stats['count'], db_ms, total_ms)
+    return response
+
+
 # =============================================================================
 # MODELS (Python Classes = Database Tables)
 # =============================================================================
@@ -13,28 +13,452 @@ What You'll Learn:
 Prerequisites: Complete part-3 (SQLAlchemy)
 """
 
-from flask import Flask, request, jsonify
+import base64
+import bisect
+import click
+import csv
+import hashlib
+import io
+import json
+import os
+import queue
+import re
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+from collections import Counter, OrderedDict, deque
+from functools import wraps
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import and_, column, event, func, literal, table, text, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DBAPIError, IntegrityError, OperationalError
+from sqlalchemy.orm import selectinload
+from datetime import date, datetime
+
+try:  # Optional fast JSON libraries: pip install orjson (or msgspec)
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:  # Optional MessagePack responses: pip install msgpack
+    import msgpack
+except ImportError:
+    msgpack = None
+try:  # Optional Brotli compression: pip install brotli
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///api_demo.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['BOOK_FTS_ENABLED'] = False  # Set by init_fts() when SQLite has FTS5
+app.config['BOOK_GROUP_COMMIT'] = False  # True = batch POST /api/books commits (see BookWriter)
+app.config['COMPRESS_MIN_SIZE'] = 1024  # Bytes; smaller responses are sent as they are
+app.config['COMPRESS_GZIP_LEVEL'] = 6  # 1 (fastest) .. 9 (smallest)
+app.config['COMPRESS_BROTLI_QUALITY'] = 4  # 0 (fastest) .. 11 (smallest)
 
 db = SQLAlchemy(app)
 
 
+# =============================================================================
+# SQL INSTRUMENTATION (Server-Timing header)
+# =============================================================================
+# SQLAlchemy engine events count and time every statement a request runs.
+# The totals go into a response header that browser dev tools show under
+# Network > Timing:
+#   Server-Timing: db;dur=3.2;desc="4 queries", app;dur=9.8
+# The same statement running many times in one request is usually an N+1
+# loop (a relationship loaded inside a for loop) and is logged as a warning.
+
+app.config['SQL_TIMING_LOG'] = False  # True = log query count and time of every request
+SQL_REPEAT_WARNING = 5  # Same statement this many times in one request = probably N+1
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    stats = g.get('sql_stats') if has_request_context() else None  # Ignore startup and background work
+    if stats is not None:
+        stats['count'] += 1
+        stats['time'] += time.perf_counter() - conn.info['query_start']
+        if not executemany and statement.lstrip()[:6].upper() == 'SELECT':  # N+1 loops are repeated reads
+            stats['statements'][statement] += 1
+
+
+@app.before_request
+def start_sql_timing():
+    g.sql_stats = {'count': 0, 'time': 0.0, 'statements': Counter(), 'start': time.perf_counter()}
+
+
+@app.after_request
+def add_server_timing(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+
+    db_ms = stats['time'] * 1000
+    total_ms = (time.perf_counter() - stats['start']) * 1000
+    response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{stats["count"]} queries"')
+    response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+
+    for statement, times in stats['statements'].items():
+        if times >= SQL_REPEAT_WARNING:
+            app.logger.warning('Possible N+1 in %s %s: %d x %s',
+                               request.method, request.path, times, ' '.join(statement.split())[:200])
+    if app.config['SQL_TIMING_LOG']:
+        app.logger.info('%s %s: %d queries, %.1f ms SQL, %.1f ms total',
+                        request.method, request.path, stats['count'], db_ms, total_ms)
+    return response
+
+
+# =============================================================================
+# FAST JSON
+# =============================================================================
+# jsonify() uses app.json to turn dicts into JSON. We plug in orjson or msgspec
+# (both written in C/Rust, several times faster) when installed, and fall back
+# to the standard json module otherwise. All three write datetimes as ISO 8601.
+
+def _json_default(value):  # Only used by the stdlib fallback and MessagePack
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if orjson:
+    JSON_BACKEND = 'orjson'
+    json_encode = orjson.dumps  # -> bytes
+    json_decode = orjson.loads
+elif msgspec:
+    JSON_BACKEND = 'msgspec'
+    json_encode = msgspec.json.encode
+    json_decode = msgspec.json.decode
+else:
+    JSON_BACKEND = 'json'
+
+    def json_encode(obj):
+        return json.dumps(obj, default=_json_default, separators=(',', ':')).encode()
+
+    json_decode = json.loads
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by json_encode() / json_decode()"""
+
+    def dumps(self, obj, **kwargs):
+        return json_encode(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return json_decode(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        mimetype = response_mimetype()
+        return self._app.response_class(encode_body(obj, mimetype), mimetype=mimetype)
+
+
+app.json = FastJSONProvider(app)
+
+
+# =============================================================================
+# MESSAGEPACK (Accept: application/msgpack)
+# =============================================================================
+# Services that call the API thousands of times per second spend a lot of
+# CPU turning JSON text into objects and back. MessagePack is a binary format
+# with the same data model (dicts, lists, strings, numbers, null), so the
+# responses keep exactly the same envelope - only the bytes differ. Clients
+# ask for it with an Accept header and may send request bodies in it too
+# (Content-Type: application/msgpack). Everyone else still gets JSON.
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')  # The second is the older unofficial name
+
+
+def msgpack_encode(obj):
+    return msgpack.packb(obj, default=_json_default)  # Datetimes as ISO 8601 strings, same as JSON
+
+
+def response_mimetype():
+    """application/msgpack if the client prefers it (Accept header), else application/json"""
+    if msgpack is None or not has_request_context():
+        return 'application/json'
+    best = request.accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES)
+    return MSGPACK_MIMETYPE if best in MSGPACK_MIMETYPES else 'application/json'  # JSON wins ties and */*
+
+
+def encode_body(obj, mimetype):
+    return msgpack_encode(obj) if mimetype == MSGPACK_MIMETYPE else json_encode(obj)
+
+
+def representation_etag(etag, mimetype):
+    """The same data as JSON and as MessagePack are different bytes, so they need different ETags"""
+    return f'{etag}-msgpack' if mimetype == MSGPACK_MIMETYPE else etag
+
+
+def request_data(silent=False):
+    """Read the request body as MessagePack (Content-Type: application/msgpack) or JSON"""
+    if request.mimetype not in MSGPACK_MIMETYPES:
+        return request.get_json(silent=silent)
+    if msgpack is None:
+        raise ApiError('MessagePack is not supported by this server, send JSON', 415)
+    try:
+        return msgpack.unpackb(request.get_data())
+    except (ValueError, TypeError, msgpack.UnpackException):
+        if silent:
+            return None
+        raise ApiError('Request body is not valid MessagePack')
+
+
+@app.after_request
+def vary_on_accept(response):
+    if msgpack is None or (response.mimetype not in ('application/json', MSGPACK_MIMETYPE)
+                           and response.status_code != 304):
+        return response
+
+    response.vary.add('Accept')  # Caches must keep one copy per format
+    etag, weak = response.get_etag()
+    if etag and response.mimetype == MSGPACK_MIMETYPE:
+        response.set_etag(representation_etag(etag, MSGPACK_MIMETYPE), weak=weak)
+    return response
+
+
+# =============================================================================
+# RESPONSE COMPRESSION (gzip / Brotli)
+# =============================================================================
+# Book lists are very repetitive JSON ("title": ..., "author": ... again and
+# again), which compresses 5-10x. If the client says it understands it
+# (Accept-Encoding header), big responses are compressed before sending.
+# Streamed responses (the export) are compressed chunk by chunk, so they are
+# never buffered in memory.
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/msgpack', 'application/x-ndjson', 'text/csv', 'text/html'}
+
+
+def new_compressor(encoding):
+    """Return (compress(bytes) -> bytes, finish() -> bytes) for 'br' or 'gzip'"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=app.config['COMPRESS_BROTLI_QUALITY'])
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(app.config['COMPRESS_GZIP_LEVEL'], zlib.DEFLATED, 31)  # 31 = gzip format
+    return compressor.compress, compressor.flush
+
+
+def compress_chunks(chunks, encoding):
+    compress, finish = new_compressor(encoding)
+    for chunk in chunks:
+        data = compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or request.method == 'HEAD'
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')  # Caches must keep one copy per encoding
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_chunks(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(b''.join(compress_chunks([data], encoding)))
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)  # Same content, different bytes -> weak ETag (still matches If-None-Match)
+    return response
+
+
+# =============================================================================
+# ADMISSION CONTROL (Load Shedding)
+# =============================================================================
+# When more requests arrive than the database can serve, they all wait in
+# the server, all of them get slow, and most time out - the work is done but
+# nobody gets the answer. Instead, only a few requests per kind (reads /
+# writes) run at once and a short queue absorbs bursts. When the queue is
+# full, or a request waited too long, it gets 503 with Retry-After right
+# away. The requests that are let in stay fast, so successful responses
+# per second stay flat under overload.
+
+ADMISSION_LIMITS = {  # kind -> (requests running at once, requests allowed to wait)
+    'read': (32, 64),
+    'write': (4, 16),  # SQLite has one writer at a time anyway
+}  # POST /api/books with BOOK_GROUP_COMMIT has its own limit, see BookWriter
+ADMISSION_MAX_WAIT = 0.5  # Seconds a request may wait in the queue
+ADMISSION_RETRY_AFTER = 1  # Seconds, sent in the Retry-After header
+ADMISSION_EXEMPT_PATHS = {'/api/metrics', '/api/books/events'}  # Monitoring, and streams that stay open for hours
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+class ConcurrencyLimit:
+    """At most max_in_flight holders; up to max_queue callers wait max_wait seconds"""
+
+    def __init__(self, max_in_flight, max_queue, max_wait):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._condition = threading.Condition()
+        self.in_flight = self.queued = 0
+        self.admitted = self.shed = 0
+
+    def acquire(self):
+        """Return True when the caller may run, False when it should be shed"""
+        with self._condition:
+            if self.in_flight >= self.max_in_flight:
+                if self.queued >= self.max_queue:
+                    self.shed += 1
+                    return False
+                self.queued += 1
+                try:
+                    if not self._condition.wait_for(lambda: self.in_flight < self.max_in_flight, self.max_wait):
+                        self.shed += 1
+                        return False
+                finally:
+                    self.queued -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'queued': self.queued,
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'shed': self.shed,
+        }
+
+
+admission_limits = {kind: ConcurrencyLimit(max_in_flight, max_queue, ADMISSION_MAX_WAIT)
+                    for kind, (max_in_flight, max_queue) in ADMISSION_LIMITS.items()}
+
+
+def admission_kind():
+    if request.method not in WRITE_METHODS:
+        return 'read'
+    if request.endpoint == 'create_book' and app.config['BOOK_GROUP_COMMIT']:
+        return 'group_commit'
+    return 'write'
+
+
+@app.before_request
+def admit_request():
+    """Wait for a free slot, or answer 503 before any database work is done"""
+    if request.path in ADMISSION_EXEMPT_PATHS:
+        return None
+    limit = admission_limits[admission_kind()]
+    if not limit.acquire():
+        response = jsonify({'success': False, 'error': 'Server is busy, please retry'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(ADMISSION_RETRY_AFTER)
+        return response
+    g.admission_limit = limit
+
+
+@app.after_request
+def hold_slot_while_streaming(response):
+    """A streamed body (the export) keeps reading the database, so keep its slot until it is sent"""
+    limit = g.get('admission_limit')
+    if limit is None or not response.is_streamed:
+        return response
+    g.admission_limit = None  # release_admission() must not free it now
+
+    released = []
+
+    def release():
+        if not released:
+            released.append(True)
+            limit.release()
+
+    def chunks(body):
+        yield from body
+        release()  # Fully sent (the test client never calls close())
+
+    response.response = chunks(response.response)
+    response.call_on_close(release)  # Client went away, or the server finished the response
+    return response
+
+
+@app.teardown_request
+def release_admission(error=None):
+    limit = g.pop('admission_limit', None)
+    if limit is not None:
+        limit.release()
+
+
 # =============================================================================
 # MODELS
 # =============================================================================
 
+class Author(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    bio = db.Column(db.Text)
+    city = db.Column(db.String(100))
+    book_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Kept up to date by triggers
+
+    # One Author has many Books. lazy='raise': author.books must be loaded on
+    # purpose (selectinload), never one query per author behind our back.
+    books = db.relationship('Book', back_populates='author_record', lazy='raise')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'bio': self.bio,
+            'city': self.city,
+            'book_count': self.book_count
+        }
+
+
 class Book(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    author = db.Column(db.String(100), nullable=False)
+    author = db.Column(db.String(100), nullable=False)  # Display name (books without an Author row keep working)
     year = db.Column(db.Integer)
     isbn = db.Column(db.String(20), unique=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    author_id = db.Column(db.Integer, db.ForeignKey('author.id'))  # Optional link to an Author
+
+    author_record = db.relationship('Author', back_populates='books', lazy='raise')
+
+    # Indexes for ?sort= and filters. Each one ends with id (SQLite adds the
+    # rowid to every index anyway), so ORDER BY <column>, id reads rows
+    # straight from the index instead of sorting them in a temporary B-tree.
+    __table_args__ = (
+        db.Index('ix_book_author', 'author'),
+        db.Index('ix_book_year_id', 'year', 'id'),
+        db.Index('ix_book_title_id', 'title', 'id'),
+        db.Index('ix_book_author_id', 'author_id'),
+    )
 
     def to_dict(self):  # Convert model to dictionary for JSON response
         return {
@@ -43,53 +467,515 @@ class Book(db.Model):
             'author': self.author,
             'year': self.year,
             'isbn': self.isbn,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'author_id': self.author_id
         }
 
 
+# List endpoints skip to_dict() and select plain column tuples instead - no
+# ORM objects to build, and the JSON encoder formats created_at itself.
+BOOK_FIELDS = ('id', 'title', 'author', 'year', 'isbn', 'created_at', 'author_id')
+BOOK_COLUMNS = [getattr(Book, field) for field in BOOK_FIELDS]
+
+
+def rows_to_dicts(rows, fields=BOOK_FIELDS):
+    return [dict(zip(fields, row)) for row in rows]  # zip() ignores extra trailing columns
+
+
+def parse_fields(args):
+    """Read ?fields=id,title into a tuple of field names (all fields when absent)"""
+    value = args.get('fields')
+    if not value:
+        return BOOK_FIELDS
+
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))  # Drop duplicates
+    unknown = [field for field in fields if field not in BOOK_FIELDS]
+    if unknown or not fields:
+        raise ApiError(f'Unknown field(s): {", ".join(unknown)}. Allowed: {", ".join(BOOK_FIELDS)}')
+    return fields
+
+
+def select_books(fields, sort='id'):
+    """SELECT only the requested columns (plus id and the sort column, which paging needs, at the end)"""
+    columns = [getattr(Book, field) for field in fields]
+    for extra in dict.fromkeys(('id', sort)):
+        if extra not in fields:
+            columns.append(getattr(Book, extra))
+    return db.select(*columns)
+
+
+# =============================================================================
+# API ERRORS
+# =============================================================================
+
+class ApiError(Exception):
+    """Raised by helpers to return a JSON error response"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@app.errorhandler(ApiError)
+def handle_api_error(error):
+    return jsonify({'success': False, 'error': error.message}), error.status
+
+
+# =============================================================================
+# KEYSET (CURSOR) PAGINATION
+# =============================================================================
+# OFFSET pagination makes the database walk and discard every skipped row, so
+# page 1000 is much slower than page 1. Keyset pagination remembers the last
+# row of the previous page and asks for rows "after" it instead, which the
+# primary key index answers directly - every page costs the same.
+
+MAX_PAGE_SIZE = 100
+SORT_COLUMNS = ('id', 'title', 'author', 'year')  # Only indexed columns can be sorted on
+
+
+def parse_limit(value):
+    """Read ?limit= and keep it between 1 and MAX_PAGE_SIZE"""
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ApiError('limit must be an integer')
+    if limit < 1:
+        raise ApiError('limit must be at least 1')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(sort, value, book_id):
+    """Pack the last row's sort key into an opaque URL-safe string"""
+    raw = json.dumps([sort, value, book_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """Unpack a cursor made by encode_cursor() for the same sort column"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, book_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ApiError('Invalid cursor')
+    if cursor_sort != sort or type(book_id) is not int:  # type(): True is an int too
+        raise ApiError('Invalid cursor')
+    column = getattr(Book, sort.lstrip('-'))  # '-year' = year descending
+    if not (value is None and column.nullable) and type(value) is not column.type.python_type:
+        raise ApiError('Invalid cursor')  # Edited by hand: a list or a dict can't be bound to the query
+    return value, book_id
+
+
+def parse_sort(args):
+    """Read ?sort=title&order=desc into ('title', True)"""
+    sort = args.get('sort', 'id')
+    order = args.get('order', 'asc')
+    if sort not in SORT_COLUMNS:
+        raise ApiError(f'sort must be one of: {", ".join(SORT_COLUMNS)}')
+    if order not in ('asc', 'desc'):
+        raise ApiError("order must be 'asc' or 'desc'")
+    return sort, order == 'desc'
+
+
+def sorted_by(stmt, sort, descending):
+    """ORDER BY <sort>, id - the id tie-breaker makes the order stable for paging"""
+    keys = [Book.id] if sort == 'id' else [getattr(Book, sort), Book.id]
+    return stmt.order_by(*[key.desc() if descending else key for key in keys])
+
+
+def after_row(sort, descending, value, last_id):
+    """WHERE clauses for the rows that come after (value, last_id), in sort order.
+
+    Each clause is a single index range. A nullable column needs a second
+    range for the NULLs, because SQLite sorts them first (asc) / last (desc).
+    """
+    if sort == 'id':
+        return [Book.id < last_id if descending else Book.id > last_id]
+
+    column = getattr(Book, sort)
+    if value is None:  # Cursor is inside the NULL block
+        in_nulls = and_(column.is_(None), Book.id < last_id if descending else Book.id > last_id)
+        return [in_nulls] if descending else [in_nulls, column.is_not(None)]
+
+    # Row-value comparison seeks straight into the (column, id) index
+    seek = tuple_(column, Book.id) < (value, last_id) if descending else tuple_(column, Book.id) > (value, last_id)
+    if descending and column.nullable:
+        return [seek, column.is_(None)]
+    return [seek]
+
+
+def keyset_page(stmt, limit, after=None, sort='id', descending=False):
+    """Run a select() of book columns for one page; return (rows, next_cursor)"""
+    cursor_key = f'-{sort}' if descending else sort  # A cursor only works with the sort it came from
+    stmt = sorted_by(stmt, sort, descending)
+
+    if after:
+        value, last_id = decode_cursor(after, cursor_key)
+        rows = []
+        for clause in after_row(sort, descending, value, last_id):  # Seek straight past the previous page
+            rows += db.session.execute(stmt.where(clause).limit(limit + 1 - len(rows))).all()
+            if len(rows) > limit:
+                break
+    else:
+        rows = db.session.execute(stmt.limit(limit + 1)).all()  # One extra row tells us if there is a next page
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(cursor_key, getattr(last, sort), last.id)
+
+
+# =============================================================================
+# IN-PROCESS CACHE
+# =============================================================================
+# A few popular books get most of the traffic. Keeping their JSON-ready dicts
+# in memory skips the database entirely for repeat lookups. The cache is
+# bounded (least recently used entries are evicted first) and every entry
+# expires after a TTL as a safety net; writes remove entries immediately.
+
+BOOK_CACHE_SIZE = 1024
+BOOK_CACHE_TTL = 60  # Seconds
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a max size and a time-to-live per entry"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value), oldest first
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]  # Expired
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)  # Mark as recently used
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)  # Drop the least recently used
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+book_cache = LRUCache(BOOK_CACHE_SIZE, BOOK_CACHE_TTL)  # book_id -> (etag, book dict)
+
+
+# =============================================================================
+# CONDITIONAL REQUESTS (ETag / If-None-Match)
+# =============================================================================
+# Every write bumps a version number for the whole table and for the book it
+# touched. The ETag of a response is built from those numbers, so when a
+# client sends back an ETag that is still current we can answer
+# 304 Not Modified without running a query or building any JSON.
+# Versions live in this process: run a single worker, or give each worker
+# its own sticky clients.
+
+BOOT_ID = uuid.uuid4().hex[:8]  # ETags from a previous run never match this one
+
+book_versions = {'table': 0, 'rows': {}, 'authors': 0}  # {'table': n, 'rows': {book_id: n}, 'authors': n}
+book_versions_lock = threading.Lock()
+
+
+def mark_books_changed(*book_ids):
+    """Call after committing a write so old ETags and cached books stop being used"""
+    with book_versions_lock:
+        book_versions['table'] += 1
+        for book_id in book_ids:
+            book_versions['rows'][book_id] = book_versions['rows'].get(book_id, 0) + 1
+    for book_id in book_ids:
+        book_cache.delete(book_id)
+    autocomplete_index.refresh(book_ids)
+    if book_ids:
+        book_events.publish()
+
+
+def mark_authors_changed():
+    """Call after an author is renamed or deleted (books embed author details)"""
+    with book_versions_lock:
+        book_versions['authors'] += 1
+
+
+def include_etag(etag, include):
+    """Responses with ?include=author also change when an author changes"""
+    return f'{etag}-a{book_versions["authors"]}' if 'author' in include else etag
+
+
+def books_etag(version=None):
+    """Pass the table version you already read, so the ETag matches the data you return"""
+    return f'{BOOT_ID}-{book_versions["table"] if version is None else version}'
+
+
+def book_etag(book_id):
+    return f'{BOOT_ID}-{book_id}-{book_versions["rows"].get(book_id, 0)}'
+
+
+def not_modified(etag):
+    """Return a 304 response if the client already has this version, else None"""
+    etag = representation_etag(etag, response_mimetype())
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+# =============================================================================
+# MULTI-GET (?ids=1,2,3)
+# =============================================================================
+# A reading list of 50 books used to mean 50 requests and 50 queries. With
+# ?ids= the API answers from the cache where it can and loads the rest with
+# one IN (...) query per chunk of ids.
+
+MULTI_GET_MAX_IDS = 1000
+MULTI_GET_CHUNK_SIZE = 500  # Keeps each IN (...) well under SQLite's bound-variable limit
+
+
+def parse_ids(value):
+    """Read ?ids=3,1,2 into a list of unique ints, keeping the request order"""
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise ApiError('ids must be a comma-separated list of integers')
+    if not ids:
+        raise ApiError('ids must not be empty')
+    ids = list(dict.fromkeys(ids))  # Drop duplicates
+    if len(ids) > MULTI_GET_MAX_IDS:
+        raise ApiError(f'At most {MULTI_GET_MAX_IDS} ids per request')
+    return ids
+
+
+def fetch_books_by_ids(ids, fields):
+    """Return {book_id: book dict} for the ids that exist"""
+    etags = {book_id: book_etag(book_id) for book_id in ids}  # Read versions BEFORE querying
+    found = {}
+
+    if fields == BOOK_FIELDS:
+        for book_id in ids:
+            entry = book_cache.get(book_id)
+            if entry and entry[0] == etags[book_id]:
+                found[book_id] = entry[1]
+
+    missing = [book_id for book_id in ids if book_id not in found]
+    for start in range(0, len(missing), MULTI_GET_CHUNK_SIZE):
+        chunk = missing[start:start + MULTI_GET_CHUNK_SIZE]
+        rows = db.session.execute(select_books(fields).where(Book.id.in_(chunk))).all()
+        for row in rows:
+            book_dict = dict(zip(fields, row))
+            found[row.id] = book_dict
+            if fields == BOOK_FIELDS:
+                book_cache.set(row.id, (etags[row.id], book_dict))
+
+    return found
+
+
+# =============================================================================
+# IDEMPOTENCY KEYS (Safe Retries for POST)
+# =============================================================================
+# A client that times out cannot know whether its POST was saved, so it sends
+# the same request again - and used to get "ISBN already exists" for its own
+# book. With an Idempotency-Key header the first response is stored; a retry
+# with the same key gets that response back after one dictionary lookup, with
+# no validation, no query and no insert. Sending the same key with a
+# different body is a client bug and gets 422.
+
+IDEMPOTENCY_CACHE_SIZE = 10000
+IDEMPOTENCY_TTL = 24 * 60 * 60  # Seconds a key is remembered
+IDEMPOTENCY_MAX_KEY_LENGTH = 255
+
+idempotency_store = LRUCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL)  # key -> (fingerprint, status, body, mimetype)
+idempotency_in_progress = set()  # Keys whose first request is still running
+idempotency_lock = threading.Lock()
+
+
+def request_fingerprint():
+    """Short hash of what the request asks for, to detect a reused key"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def idempotent(view):
+    """Replay the stored response when a request repeats its Idempotency-Key"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > IDEMPOTENCY_MAX_KEY_LENGTH:
+            raise ApiError(f'Idempotency-Key must be 1 to {IDEMPOTENCY_MAX_KEY_LENGTH} characters')
+
+        fingerprint = request_fingerprint()
+        with idempotency_lock:
+            stored = idempotency_store.get(key)
+            if stored is None:
+                if key in idempotency_in_progress:
+                    raise ApiError('A request with this Idempotency-Key is still in progress', 409)
+                idempotency_in_progress.add(key)
+
+        if stored is not None:
+            if stored[0] != fingerprint:
+                raise ApiError('Idempotency-Key was already used for a different request', 422)
+            response = Response(stored[2], status=stored[1], mimetype=stored[3])
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code < 500:  # Server errors are worth retrying for real
+                idempotency_store.set(key, (fingerprint, response.status_code, response.get_data(), response.mimetype))
+            return response
+        finally:
+            with idempotency_lock:
+                idempotency_in_progress.discard(key)
+    return wrapper
+
+
 # =============================================================================
 # REST API ROUTES
 # =============================================================================
 
 # GET /api/books - Get all books
+# GET /api/books?limit=20&after=<next_cursor> - Get one page of books
+# GET /api/books?sort=title&order=desc - Sorted (works with paging too)
+# GET /api/books?ids=3,1,2 - Several books by id, in that order
 @app.route('/api/books', methods=['GET'])
 def get_books():
-    books = Book.query.all()
-    return jsonify({  # Return JSON response
-        'success': True,
-        'count': len(books),
-        'books': [book.to_dict() for book in books]  # List comprehension to convert all
-    })
+    include = parse_include(request.args)  # ?include=author -> embed each book's author
+    etag = include_etag(books_etag(), include)  # Read the version BEFORE querying, never after
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    ids = request.args.get('ids')
+    fields = fields_for_include(parse_fields(request.args), include)  # ?fields=id,title -> SELECT id, title only
+    sort, descending = parse_sort(request.args)  # ?sort=title&order=desc
+
+    if ids is not None:
+        ids = parse_ids(ids)
+        found = fetch_books_by_ids(ids, fields)
+        response = jsonify({
+            'success': True,
+            'count': len(found),
+            'books': embed_includes([found[book_id] for book_id in ids if book_id in found], include),  # ?ids= order
+            'missing': [book_id for book_id in ids if book_id not in found]
+        })
+    elif limit is None and after is None:
+        rows = db.session.execute(sorted_by(select_books(fields, sort), sort, descending)).all()
+        response = jsonify({  # Return JSON response
+            'success': True,
+            'count': len(rows),
+            'books': embed_includes(rows_to_dicts(rows, fields), include)
+        })
+    else:
+        rows, next_cursor = keyset_page(
+            select_books(fields, sort), parse_limit(limit or MAX_PAGE_SIZE), after, sort, descending
+        )
+        response = jsonify({
+            'success': True,
+            'count': len(rows),
+            'books': embed_includes(rows_to_dicts(rows, fields), include),
+            'next_cursor': next_cursor  # Pass as ?after= to get the next page (null on the last page)
+        })
+
+    response.set_etag(etag)
+    return response
 
 
 # GET /api/books/<id> - Get single book
 @app.route('/api/books/<int:id>', methods=['GET'])
 def get_book(id):
-    book = Book.query.get(id)
-
-    if not book:
+    include = parse_include(request.args)
+    etag = book_etag(id)
+    cached = not_modified(include_etag(etag, include))
+    if cached:
+        return cached
+
+    fields = fields_for_include(parse_fields(request.args), include)
+    entry = book_cache.get(id)
+    if entry and entry[0] == etag:  # Cached copy is from the current version
+        book_dict = entry[1]
+    elif fields != BOOK_FIELDS:  # Partial row: load only those columns, don't cache it
+        row = db.session.execute(select_books(fields).where(Book.id == id)).first()
+        book_dict = rows_to_dicts([row], fields)[0] if row else None
+    else:
+        book = Book.query.get(id)
+        book_dict = book.to_dict() if book else None
+        if book_dict:
+            book_cache.set(id, (etag, book_dict))
+
+    if not book_dict:
         return jsonify({
             'success': False,
             'error': 'Book not found'
         }), 404  # Return 404 status code
 
-    return jsonify({
+    if fields != BOOK_FIELDS:
+        book_dict = {field: book_dict[field] for field in fields}
+
+    response = jsonify({
         'success': True,
-        'book': book.to_dict()
+        'book': embed_includes([book_dict], include)[0]
     })
+    response.set_etag(include_etag(etag, include))
+    return response
 
 
-# POST /api/books - Create new book
+# POST /api/books - Create new book (send an Idempotency-Key header to retry safely)
 @app.route('/api/books', methods=['POST'])
+@idempotent
 def create_book():
-    data = request.get_json()  # Get JSON data from request body
+    data = request_data()  # Get JSON (or MessagePack) data from request body
 
     # Validation
-    if not data:
-        return jsonify({'success': False, 'error': 'No data provided'}), 400
-
-    if not data.get('title') or not data.get('author'):
-        return jsonify({'success': False, 'error': 'Title and author are required'}), 400
+    error = book_data_error(data)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    if app.config['BOOK_GROUP_COMMIT']:  # Let the writer thread commit it together with other requests
+        result = book_writer.submit(data)
+        if not result['success']:
+            status = result.get('status', 400)  # 400 = bad data, 500/503 = server problem (not stored for Idempotency-Key)
+            headers = {'Retry-After': str(ADMISSION_RETRY_AFTER)} if status == 503 else {}
+            return jsonify({'success': False, 'error': result['error']}), status, headers
+        return jsonify({
+            'success': True,
+            'message': 'Book created successfully',
+            'book': result['book']
+        }), 201
 
     # Check for duplicate ISBN
     if data.get('isbn'):
@@ -97,16 +983,20 @@ def create_book():
         if existing:
             return jsonify({'success': False, 'error': 'ISBN already exists'}), 400
 
+    check_author_id(data.get('author_id'))
+
     # Create book
     new_book = Book(
         title=data['title'],
         author=data['author'],
         year=data.get('year'),  # Optional field
-        isbn=data.get('isbn')
+        isbn=data.get('isbn'),
+        author_id=data.get('author_id')
     )
 
     db.session.add(new_book)
     db.session.commit()
+    mark_books_changed(new_book.id)
 
     return jsonify({
         'success': True,
@@ -123,11 +1013,16 @@ def update_book(id):
     if not book:
         return jsonify({'success': False, 'error': 'Book not found'}), 404
 
-    data = request.get_json()
+    data = request_data()
 
     if not data:
         return jsonify({'success': False, 'error': 'No data provided'}), 400
 
+    for field in PATCH_FIELDS:  # Same fields and types as PATCH
+        error = book_field_error(field, data[field]) if field in data else None
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+
     # Update fields if provided
     if 'title' in data:
         book.title = data['title']
@@ -137,8 +1032,11 @@ def update_book(id):
         book.year = data['year']
     if 'isbn' in data:
         book.isbn = data['isbn']
+    if 'author_id' in data:
+        book.author_id = check_author_id(data['author_id'])
 
     db.session.commit()
+    mark_books_changed(id)
 
     return jsonify({
         'success': True,
@@ -147,6 +1045,61 @@ def update_book(id):
     })
 
 
+# PATCH /api/books/<id> - Update only the given fields
+# One UPDATE ... RETURNING statement: no SELECT first, no ORM object. A
+# duplicate ISBN is caught by the UNIQUE constraint itself, so two requests
+# racing for the same ISBN can never both succeed.
+PATCH_FIELDS = ('title', 'author', 'year', 'isbn', 'author_id')
+
+
+@app.route('/api/books/<int:id>', methods=['PATCH'])
+def patch_book(id):
+    data = request_data(silent=True)
+
+    if not data or not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'No data provided'}), 400
+
+    unknown = [field for field in data if field not in PATCH_FIELDS]
+    if unknown:
+        return jsonify({'success': False, 'error': f'Unknown field(s): {", ".join(unknown)}'}), 400
+
+    values = {field: data[field] for field in PATCH_FIELDS if field in data}
+    for field, value in values.items():
+        error = book_field_error(field, value)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+    if ('title' in values and not values['title']) or ('author' in values and not values['author']):
+        return jsonify({'success': False, 'error': 'Title and author cannot be empty'}), 400
+    if 'isbn' in values:
+        values['isbn'] = values['isbn'] or None  # '' means "no ISBN"
+    if 'author_id' in values:
+        check_author_id(values['author_id'])
+
+    stmt = db.update(Book).where(Book.id == id).values(**values) \
+        .execution_options(synchronize_session=False)  # Nothing in the session to keep in sync
+    try:
+        if db.engine.dialect.update_returning:  # SQLite 3.35+, PostgreSQL, MariaDB...
+            row = db.session.execute(stmt.returning(*BOOK_COLUMNS)).first()
+        else:
+            updated = db.session.execute(stmt).rowcount
+            row = db.session.execute(db.select(*BOOK_COLUMNS).where(Book.id == id)).first() if updated else None
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'ISBN already exists'}), 400
+
+    if row is None:
+        return jsonify({'success': False, 'error': 'Book not found'}), 404
+
+    mark_books_changed(id)
+
+    return jsonify({
+        'success': True,
+        'message': 'Book updated successfully',
+        'book': dict(zip(BOOK_FIELDS, row))
+    })
+
+
 # DELETE /api/books/<id> - Delete book
 @app.route('/api/books/<int:id>', methods=['DELETE'])
 def delete_book(id):
@@ -157,6 +1110,7 @@ def delete_book(id):
 
     db.session.delete(book)
     db.session.commit()
+    mark_books_changed(id)
 
     return jsonify({
         'success': True,
@@ -164,37 +1118,1282 @@ def delete_book(id):
     })
 
 
+# GET /api/metrics - Cache, writer and admission counters (for monitoring)
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({
+        'success': True,
+        'book_cache': book_cache.stats(),
+        'search_cache': search_cache.stats(),
+        'idempotency_keys': idempotency_store.stats(),
+        'group_commit': book_writer.stats(),
+        'admission': {kind: limit.stats() for kind, limit in admission_limits.items()},
+        'event_streams': book_events.clients
+    })
+
+
+# =============================================================================
+# AUTHORS (One Author, Many Books)
+# =============================================================================
+# Embedding the author in every book with book.author_record would run one
+# query per book (the "N+1" problem). Instead ?include=author collects the
+# author ids of the whole page and loads them with ONE extra IN (...) query -
+# the same query selectinload() sends for ORM objects. The relationships are
+# lazy='raise', so a forgotten per-row load fails loudly instead of quietly
+# running hundreds of queries. book_count is kept up to date by triggers, so
+# listing authors never counts books.
+
+AUTHOR_FIELDS = ('id', 'name', 'bio', 'city', 'book_count')
+AUTHOR_EMBED_FIELDS = ('id', 'name', 'bio', 'city')  # No book_count: it changes with every book written
+AUTHOR_WRITE_FIELDS = ('name', 'bio', 'city')
+INCLUDE_OPTIONS = ('author',)
+
+AUTHOR_COUNT_SETUP = [
+    """CREATE TRIGGER IF NOT EXISTS author_count_insert AFTER INSERT ON book WHEN new.author_id IS NOT NULL BEGIN
+        UPDATE author SET book_count = book_count + 1 WHERE id = new.author_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS author_count_delete AFTER DELETE ON book WHEN old.author_id IS NOT NULL BEGIN
+        UPDATE author SET book_count = book_count - 1 WHERE id = old.author_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS author_count_update AFTER UPDATE OF author_id ON book
+       WHEN old.author_id IS NOT new.author_id BEGIN
+        UPDATE author SET book_count = book_count - 1 WHERE id = old.author_id;
+        UPDATE author SET book_count = book_count + 1 WHERE id = new.author_id;
+    END""",
+]
+
+
+def init_authors():
+    """Add book.author_id to older databases and create the book_count triggers"""
+    columns = {row[1] for row in db.session.execute(text('PRAGMA table_info(book)'))}
+    if 'author_id' not in columns:  # create_all() never changes an existing table
+        db.session.execute(text('ALTER TABLE book ADD COLUMN author_id INTEGER REFERENCES author(id)'))
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'author_count_insert'")
+    ).first()
+    for statement in AUTHOR_COUNT_SETUP:
+        db.session.execute(text(statement))
+    if not exists:
+        db.session.execute(text(
+            'UPDATE author SET book_count = (SELECT count(*) FROM book WHERE book.author_id = author.id)'
+        ))
+    db.session.commit()
+
+
+def parse_include(args):
+    """Read ?include=author into a set of names"""
+    include = {name.strip() for name in args.get('include', '').split(',') if name.strip()}
+    unknown = include - set(INCLUDE_OPTIONS)
+    if unknown:
+        raise ApiError(f'Unknown include(s): {", ".join(sorted(unknown))}. Allowed: {", ".join(INCLUDE_OPTIONS)}')
+    return include
+
+
+def fields_for_include(fields, include):
+    """?include=author needs author_id even when ?fields= left it out"""
+    if 'author' in include and 'author_id' not in fields:
+        return fields + ('author_id',)
+    return fields
+
+
+def existing_author_ids(author_ids):
+    """The subset of author_ids that exist (one IN query per chunk)"""
+    author_ids = list(author_ids)
+    found = set()
+    for start in range(0, len(author_ids), MULTI_GET_CHUNK_SIZE):
+        chunk = author_ids[start:start + MULTI_GET_CHUNK_SIZE]
+        found.update(db.session.scalars(db.select(Author.id).where(Author.id.in_(chunk))))
+    return found
+
+
+def check_author_id(author_id):
+    """Return author_id if it is empty or exists, else raise a 400"""
+    if author_id is None:
+        return None
+    if not isinstance(author_id, int) or isinstance(author_id, bool):
+        raise ApiError('author_id must be an integer')
+    if not existing_author_ids([author_id]):
+        raise ApiError('Author not found')
+    return author_id
+
+
+def embed_includes(books, include):
+    """Return copies of the book dicts with 'author_details' added (one query for all authors)"""
+    if 'author' not in include:
+        return books
+
+    author_ids = list({book['author_id'] for book in books if book['author_id'] is not None})
+    authors = {}
+    for start in range(0, len(author_ids), MULTI_GET_CHUNK_SIZE):
+        chunk = author_ids[start:start + MULTI_GET_CHUNK_SIZE]
+        columns = [getattr(Author, field) for field in AUTHOR_EMBED_FIELDS]
+        for row in db.session.execute(db.select(*columns).where(Author.id.in_(chunk))):
+            authors[row.id] = dict(zip(AUTHOR_EMBED_FIELDS, row))
+
+    # Copies: book dicts may come from book_cache and must not change there
+    return [dict(book, author_details=authors.get(book['author_id'])) for book in books]
+
+
+def author_data_error(data, partial=False):
+    if not isinstance(data, dict) or not data:
+        return 'No data provided'
+    unknown = [field for field in data if field not in AUTHOR_WRITE_FIELDS]
+    if unknown:
+        return f'Unknown field(s): {", ".join(unknown)}'
+    if ('name' in data or not partial) and not data.get('name'):
+        return 'Name is required'
+    return None
+
+
+# GET /api/authors - All authors with their number of books
+@app.route('/api/authors', methods=['GET'])
+def get_authors():
+    columns = [getattr(Author, field) for field in AUTHOR_FIELDS]
+    rows = db.session.execute(db.select(*columns).order_by(Author.id)).all()
+    return jsonify({
+        'success': True,
+        'count': len(rows),
+        'authors': [dict(zip(AUTHOR_FIELDS, row)) for row in rows]
+    })
+
+
+# GET /api/authors/<id> - Single author
+# GET /api/authors/<id>?include=books - ... with their books (one extra query)
+@app.route('/api/authors/<int:id>', methods=['GET'])
+def get_author(id):
+    include_books = request.args.get('include') == 'books'
+    query = db.select(Author).where(Author.id == id)
+    if include_books:
+        query = query.options(selectinload(Author.books))  # SELECT ... FROM book WHERE author_id IN (...)
+    author = db.session.scalars(query).first()
+
+    if not author:
+        return jsonify({'success': False, 'error': 'Author not found'}), 404
+
+    author_dict = author.to_dict()
+    if include_books:
+        author_dict['books'] = [book.to_dict() for book in sorted(author.books, key=lambda book: book.id)]
+    return jsonify({
+        'success': True,
+        'author': author_dict
+    })
+
+
+# POST /api/authors - Create new author
+@app.route('/api/authors', methods=['POST'])
+def create_author():
+    data = request_data(silent=True)
+    error = author_data_error(data)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    author = Author(name=data['name'], bio=data.get('bio'), city=data.get('city'))
+    db.session.add(author)
+    db.session.commit()
+
+    return jsonify({
+        'success': True,
+        'message': 'Author created successfully',
+        'author': author.to_dict()
+    }), 201
+
+
+# PUT /api/authors/<id> - Update author
+@app.route('/api/authors/<int:id>', methods=['PUT'])
+def update_author(id):
+    author = Author.query.get(id)
+
+    if not author:
+        return jsonify({'success': False, 'error': 'Author not found'}), 404
+
+    data = request_data(silent=True)
+    error = author_data_error(data, partial=True)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    for field in AUTHOR_WRITE_FIELDS:
+        if field in data:
+            setattr(author, field, data[field])
+
+    db.session.commit()
+    mark_authors_changed()
+
+    return jsonify({
+        'success': True,
+        'message': 'Author updated successfully',
+        'author': author.to_dict()
+    })
+
+
+# DELETE /api/authors/<id> - Delete author (their books stay, without author_id)
+@app.route('/api/authors/<int:id>', methods=['DELETE'])
+def delete_author(id):
+    unlinked = db.session.scalars(db.select(Book.id).where(Book.author_id == id)).all()
+    db.session.execute(
+        db.update(Book).where(Book.author_id == id).values(author_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    deleted = db.session.execute(db.delete(Author).where(Author.id == id)).rowcount
+    if not deleted:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Author not found'}), 404
+
+    db.session.commit()
+    mark_books_changed(*unlinked)
+    mark_authors_changed()
+
+    return jsonify({
+        'success': True,
+        'message': 'Author deleted successfully'
+    })
+
+
+# =============================================================================
+# BONUS: Stats (Counts per Year / Author)
+# =============================================================================
+# Dashboards want counts per year and per author. GROUP BY in SQL does that
+# without sending every book to the client. The result only changes when the
+# table version changes, so it is cached until the next write, and a lock
+# makes sure only one request recomputes it while the others wait and reuse it.
+
+book_stats_cache = {'entry': None}  # {'entry': (table_version, stats)}
+book_stats_lock = threading.Lock()
+
+
+def compute_book_stats():
+    """Count books per year and per author with ONE aggregate query (UNION ALL)"""
+    by_year = db.select(literal('year').label('facet'), Book.year.label('value'), func.count().label('count')) \
+        .group_by(Book.year)
+    by_author = db.select(literal('author'), Book.author, func.count()).group_by(Book.author)
+
+    stats = {'total': 0, 'by_year': [], 'by_author': []}
+    for facet, value, count in db.session.execute(by_year.union_all(by_author)):
+        if facet == 'year':
+            stats['total'] += count
+            stats['by_year'].append({'year': value, 'count': count})
+        else:
+            stats['by_author'].append({'author': value, 'count': count})
+    return stats
+
+
+def get_book_stats(version):
+    entry = book_stats_cache['entry']
+    if entry and entry[0] == version:
+        return entry[1]
+
+    with book_stats_lock:
+        entry = book_stats_cache['entry']
+        if entry and entry[0] == version:  # Another request computed it while we waited
+            return entry[1]
+        stats = compute_book_stats()
+        book_stats_cache['entry'] = (version, stats)
+        return stats
+
+
+# GET /api/books/stats - Number of books per year and per author
+@app.route('/api/books/stats', methods=['GET'])
+def book_stats():
+    version = book_versions['table']  # Read the version BEFORE querying, never after
+    etag = books_etag(version)  # Same read as the stats below: a write in between can't mix old stats with a new ETag
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    response = jsonify({'success': True, **get_book_stats(version)})
+    response.set_etag(etag)
+    return response
+
+
+# =============================================================================
+# BONUS: Autocomplete (In-Memory Prefix Index)
+# =============================================================================
+# A search box asks on every keystroke, so this must be fast. All titles and
+# authors are kept in memory as one sorted list of (normalized text, book id).
+# Every string starting with "pyt" sits in one block of that list, and
+# bisect finds the block in O(log n) - no database query at all.
+# The list is built once and then patched by mark_books_changed().
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+AUTOCOMPLETE_REBUILD_THRESHOLD = 1000  # Bigger write batches re-sort the list instead of inserting one by one
+
+
+def normalize_text(value):
+    """'Café  Society' -> 'cafe society' (lowercase, no accents, single spaces)"""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.casefold().split())
+
+
+class PrefixIndex:
+    """Sorted list of (normalized title/author, book id) searched with bisect"""
+
+    def __init__(self):
+        self._keys = []  # Sorted [(text, book_id), ...] - one entry for the title, one for the author
+        self._books = {}  # book_id -> (title, author), to answer without the database
+        self._lock = threading.Lock()
+        self.ready = False
+
+    @staticmethod
+    def _entries(book_id, title, author):
+        return [(normalize_text(title), book_id), (normalize_text(author), book_id)]
+
+    def _load(self, book_ids=None):
+        """Read (id, title, author) rows from the database, all of them or only book_ids"""
+        stmt = db.select(Book.id, Book.title, Book.author)
+        if book_ids is None:
+            return db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE)).all()
+        rows = []
+        for start in range(0, len(book_ids), MULTI_GET_CHUNK_SIZE):
+            rows += db.session.execute(stmt.where(Book.id.in_(book_ids[start:start + MULTI_GET_CHUNK_SIZE]))).all()
+        return rows
+
+    def build(self):
+        with self._lock:
+            books = {book_id: (title, author) for book_id, title, author in self._load()}
+            keys = [entry for book_id, (title, author) in books.items() for entry in self._entries(book_id, title, author)]
+            keys.sort()
+            self._keys, self._books, self.ready = keys, books, True
+
+    def refresh(self, book_ids):
+        """Re-read the given books after a write (deleted ones disappear)"""
+        if not self.ready or not book_ids:
+            return
+        # Read and apply under one lock: two writes to the same book then apply
+        # in the order they were read, so the newest title always wins
+        with self._lock:
+            try:
+                rows = self._load(list(book_ids))
+            except Exception:
+                app.logger.exception('Autocomplete refresh failed, index will be rebuilt')
+                self.ready = False
+                return
+
+            for book_id in book_ids:
+                old = self._books.pop(book_id, None)
+                if old and len(book_ids) <= AUTOCOMPLETE_REBUILD_THRESHOLD:
+                    for entry in self._entries(book_id, *old):
+                        index = bisect.bisect_left(self._keys, entry)
+                        if index < len(self._keys) and self._keys[index] == entry:
+                            del self._keys[index]
+            if len(book_ids) > AUTOCOMPLETE_REBUILD_THRESHOLD:
+                changed = set(book_ids)
+                self._keys = [entry for entry in self._keys if entry[1] not in changed]
+
+            for book_id, title, author in rows:
+                self._books[book_id] = (title, author)
+                for entry in self._entries(book_id, title, author):
+                    if len(book_ids) <= AUTOCOMPLETE_REBUILD_THRESHOLD:
+                        bisect.insort(self._keys, entry)
+                    else:
+                        self._keys.append(entry)
+            if len(book_ids) > AUTOCOMPLETE_REBUILD_THRESHOLD:
+                self._keys.sort()  # Timsort is fast on a list that is mostly sorted already
+
+    def search(self, prefix, limit):
+        """Return up to `limit` books whose title or author starts with prefix"""
+        prefix = normalize_text(prefix)
+        results = {}
+        with self._lock:
+            index = bisect.bisect_left(self._keys, (prefix,))
+            while index < len(self._keys) and len(results) < limit:
+                text_key, book_id = self._keys[index]
+                if not text_key.startswith(prefix):
+                    break
+                if book_id not in results:
+                    title, author = self._books[book_id]
+                    results[book_id] = {'id': book_id, 'title': title, 'author': author}
+                index += 1
+        return list(results.values())
+
+
+autocomplete_index = PrefixIndex()
+
+
+# GET /api/books/autocomplete?prefix=pyt&limit=10 - Title/author suggestions
+@app.route('/api/books/autocomplete', methods=['GET'])
+def autocomplete_books():
+    prefix = request.args.get('prefix', '')
+    if not normalize_text(prefix):
+        raise ApiError('prefix is required')
+    limit = min(parse_limit(request.args.get('limit', AUTOCOMPLETE_DEFAULT_LIMIT)), AUTOCOMPLETE_MAX_LIMIT)
+
+    if not autocomplete_index.ready:  # Started without init_db(), or a refresh failed
+        autocomplete_index.build()
+
+    suggestions = autocomplete_index.search(prefix, limit)
+    return jsonify({
+        'success': True,
+        'count': len(suggestions),
+        'suggestions': suggestions
+    })
+
+
+# =============================================================================
+# BONUS: Bulk Create
+# =============================================================================
+# Creating books one POST at a time costs a duplicate-ISBN query and a commit
+# per book. The bulk endpoint checks a whole chunk of ISBNs with one IN query,
+# inserts the chunk with one executemany, and commits everything once.
+
+BULK_MAX_ITEMS = 100000
+BULK_CHUNK_SIZE = 500  # Keeps each IN (...) well under SQLite's bound-variable limit
+
+
+def book_field_error(field, value):
+    """Return the error for one field value sent by a client, or None if its type is right"""
+    if field in ('title', 'author'):
+        return None if isinstance(value, str) else f'{field} must be a string'
+    if value is None:  # year, isbn and author_id are optional
+        return None
+    if field == 'isbn':
+        return None if isinstance(value, str) else 'isbn must be a string'
+    if field in ('year', 'author_id'):
+        return None if isinstance(value, int) and not isinstance(value, bool) else f'{field} must be an integer'
+    return None
+
+
+def book_data_error(data):
+    """Return the validation error for one book's data, or None if it is valid"""
+    if not isinstance(data, dict) or not data:
+        return 'No data provided'
+    if not data.get('title') or not data.get('author'):
+        return 'Title and author are required'
+    for field in ('title', 'author', 'year', 'isbn', 'author_id'):  # Wrong types would fail inside the INSERT
+        error = book_field_error(field, data.get(field))
+        if error:
+            return error
+    return None
+
+
+def insert_books(items, include_books=False):
+    """Insert a list of book dicts in the current transaction (caller commits).
+
+    Returns one result per item: {'index', 'success', 'id'} or {'index', 'success', 'error'}.
+    With include_books=True successful results also carry the new row as 'book'.
+    """
+    results = [None] * len(items)
+    seen_isbns = set()  # Duplicates inside the same request
+
+    for start in range(0, len(items), BULK_CHUNK_SIZE):
+        chunk = list(enumerate(items[start:start + BULK_CHUNK_SIZE], start))
+
+        errors = {index: book_data_error(data) for index, data in chunk}
+        isbns = {data['isbn'] for index, data in chunk if not errors[index] and data.get('isbn')}
+        existing = set(db.session.scalars(
+            db.select(Book.isbn).where(Book.isbn.in_(isbns))  # One query for the whole chunk
+        )) if isbns else set()
+        author_ids = {data['author_id'] for index, data in chunk if not errors[index] and data.get('author_id')}
+        authors = existing_author_ids(author_ids)
+
+        rows, row_indexes = [], []
+        for index, data in chunk:
+            error = errors[index]
+            isbn = None if error else data.get('isbn') or None
+            if isbn and (isbn in existing or isbn in seen_isbns):
+                error = 'ISBN already exists'
+            elif not error and data.get('author_id') is not None and data['author_id'] not in authors:
+                error = 'Author not found'
+            if error:
+                results[index] = {'index': index, 'success': False, 'error': error}
+                continue
+
+            if isbn:
+                seen_isbns.add(isbn)  # Only rows that will really be inserted claim their ISBN
+            rows.append({'title': data['title'], 'author': data['author'], 'year': data.get('year'), 'isbn': isbn,
+                         'author_id': data.get('author_id')})
+            row_indexes.append(index)
+
+        if rows:
+            new_rows = db.session.execute(
+                db.insert(Book).returning(*BOOK_COLUMNS, sort_by_parameter_order=True), rows
+            ).all()
+            for index, row in zip(row_indexes, new_rows):
+                results[index] = {'index': index, 'success': True, 'id': row.id}
+                if include_books:
+                    results[index]['book'] = dict(zip(BOOK_FIELDS, row))
+
+    return results
+
+
+def read_bulk_items():
+    """Read the request body as a JSON or MessagePack array, or as NDJSON (one object per line)"""
+    if request.mimetype == 'application/x-ndjson':
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)  # Reported as 'No data provided' for that line
+        return items
+
+    items = request_data(silent=True)
+    if not isinstance(items, list):
+        raise ApiError('Expected a JSON (or MessagePack) array of books')
+    return items
+
+
+# POST /api/books/bulk - Create many books at once
+@app.route('/api/books/bulk', methods=['POST'])
+def create_books_bulk():
+    items = read_bulk_items()
+
+    if not items:
+        raise ApiError('No data provided')
+    if len(items) > BULK_MAX_ITEMS:
+        raise ApiError(f'At most {BULK_MAX_ITEMS} books per request')
+
+    try:
+        results = insert_books(items)
+        db.session.commit()  # One transaction for the whole request
+    except IntegrityError:  # A concurrent request inserted one of our ISBNs first
+        db.session.rollback()
+        raise ApiError('ISBN already exists (concurrent write), please retry', 409)
+
+    created = [result['id'] for result in results if result['success']]
+    mark_books_changed(*created)
+
+    return jsonify({
+        'success': len(created) == len(results),
+        'created': len(created),
+        'failed': len(results) - len(created),
+        'results': results
+    }), 201 if created else 400
+
+
+# =============================================================================
+# BONUS: Bulk Import (flask import-books)
+# =============================================================================
+# Loading a real catalog through the API means one HTTP request per batch
+# and an ISBN check per book. The import command reads a CSV or JSONL file
+# in chunks, inserts each chunk with one executemany, lets SQLite resolve
+# ISBN conflicts (ON CONFLICT ... DO UPDATE = upsert) and commits only every
+# IMPORT_COMMIT_ROWS rows. SQLite is told not to wait for the disk during the
+# import (synchronous = OFF): if the machine crashes, just run it again.
+# Updating the secondary indexes and the full-text index row by row costs
+# more than the inserts themselves, so for big files they are dropped first
+# and built once at the end (the change-feed triggers stay, so sync clients
+# see the import). Small files keep them: rebuilding for a few rows would
+# cost more than it saves.
+#
+#   flask --app app import-books books.csv
+#   flask --app app import-books books.jsonl --chunk-size 10000
+
+IMPORT_CHUNK_SIZE = 5000
+IMPORT_COMMIT_ROWS = 200000
+IMPORT_REBUILD_MIN_BYTES = 10 * 1024 * 1024  # Files this big drop and rebuild the indexes
+IMPORT_PRAGMAS = [
+    'PRAGMA synchronous = OFF',  # Don't fsync every commit
+    'PRAGMA cache_size = -262144',  # 256 MB page cache (negative = KiB)
+    'PRAGMA temp_store = MEMORY',
+]
+
+
+def read_import_rows(file, file_format):
+    """Yield one dict per CSV row or JSONL line (None for a line that is not valid JSON)"""
+    if file_format == 'csv':
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if line.strip():
+            try:
+                yield json_decode(line)
+            except ValueError:
+                yield None
+
+
+def import_number(value):
+    """CSV cells are strings: '' -> None, '2019' -> 2019 (JSONL numbers pass through)"""
+    if value is None or value == '':
+        return None
+    return int(value) if isinstance(value, str) else value  # book_data_error() checks the rest
+
+
+def import_row(data):
+    """Turn one file row into insert parameters, or None if it is invalid"""
+    if not isinstance(data, dict):
+        return None
+    try:
+        data = dict(data, year=import_number(data.get('year')), author_id=import_number(data.get('author_id')))
+    except ValueError:
+        return None
+    if book_data_error(data):
+        return None
+    return {
+        'title': data['title'],
+        'author': data['author'],
+        'year': data['year'],
+        'isbn': data.get('isbn') or None,
+        'author_id': data['author_id'],
+        'created_at': datetime.utcnow(),
+    }
+
+
+def upsert_books(rows):
+    """INSERT the rows; a row whose ISBN already exists updates that book instead.
+
+    Rows linked to an author that does not exist are left out. Returns how many rows were written.
+    """
+    authors = existing_author_ids({row['author_id'] for row in rows if row['author_id'] is not None})
+    rows = [row for row in rows if row['author_id'] is None or row['author_id'] in authors]
+    if not rows:
+        return 0
+
+    stmt = sqlite_insert(Book)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Book.isbn],
+        set_={
+            **{name: stmt.excluded[name] for name in ('title', 'author', 'year')},
+            'author_id': func.coalesce(stmt.excluded.author_id, Book.author_id),  # Empty cell keeps the link
+        }
+    )
+    db.session.execute(stmt, rows)
+    return len(rows)
+
+
+def drop_for_bulk_load():
+    """Drop the secondary indexes and full-text triggers; finish_bulk_load() builds them again"""
+    for index in Book.__table__.indexes:
+        db.session.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+    for trigger in ('book_fts_insert', 'book_fts_delete', 'book_fts_update'):
+        db.session.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+    db.session.commit()
+
+
+def finish_bulk_load():
+    create_schema()  # Indexes and triggers back
+    if app.config['BOOK_FTS_ENABLED']:
+        db.session.execute(text("INSERT INTO book_fts(book_fts) VALUES ('rebuild')"))
+        db.session.commit()
+
+
+@app.cli.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+              help='File format (default: from the file extension)')
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='Rows per executemany')
+def import_books_command(path, file_format, chunk_size):
+    """Import books from a CSV or JSONL file (upsert on ISBN)"""
+    file_format = file_format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    create_schema()
+    for pragma in IMPORT_PRAGMAS:
+        db.session.execute(text(pragma))
+
+    books_before = db.session.scalar(db.select(func.count(Book.id)))
+    started = time.perf_counter()
+    processed = skipped = uncommitted = 0
+    chunk = []
+
+    rebuild_indexes = os.path.getsize(path) >= IMPORT_REBUILD_MIN_BYTES
+    if rebuild_indexes:
+        drop_for_bulk_load()
+    try:
+        with open(path, newline='', encoding='utf-8') as file:
+            for data in read_import_rows(file, file_format):
+                row = import_row(data)
+                if row is None:
+                    skipped += 1
+                    continue
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    written = upsert_books(chunk)
+                    processed += written
+                    skipped += len(chunk) - written  # Unknown author_id
+                    uncommitted += written
+                    chunk = []
+                    if uncommitted >= IMPORT_COMMIT_ROWS:
+                        db.session.commit()
+                        uncommitted = 0
+                        click.echo(f'{processed} rows ({processed / (time.perf_counter() - started):,.0f} rows/s)')
+            if chunk:
+                written = upsert_books(chunk)
+                processed += written
+                skipped += len(chunk) - written
+        db.session.commit()
+    finally:
+        db.session.rollback()  # Nothing to undo after the commit; after an error, keep the committed chunks
+        if rebuild_indexes:
+            click.echo('Building indexes...')
+            finish_bulk_load()
+
+    elapsed = time.perf_counter() - started
+    created = db.session.scalar(db.select(func.count(Book.id))) - books_before
+    click.echo(f'Imported {processed} rows in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):,.0f} rows/s): '
+               f'{created} created, {processed - created} updated, {skipped} skipped')
+
+
+# =============================================================================
+# BONUS: Group Commit (Write Coalescing)
+# =============================================================================
+# Every commit waits for the disk (fsync), so one commit per POST caps how
+# many books per second we can create. With BOOK_GROUP_COMMIT = True,
+# create_book() hands its data to one writer thread instead. The writer
+# collects whatever arrives within GROUP_COMMIT_MAX_WAIT seconds (at most
+# GROUP_COMMIT_MAX_BATCH books), inserts them with insert_books() and commits
+# once. Each request waits until ITS book is committed, so a 201 still means
+# "saved on disk" - just like before.
+
+GROUP_COMMIT_MAX_BATCH = 256
+GROUP_COMMIT_MAX_WAIT = 0.005  # Seconds
+
+
+class BookWriter:
+    """Background thread that commits queued book inserts in micro-batches"""
+
+    def __init__(self, max_batch, max_wait):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = self.books = 0
+
+    def submit(self, data):
+        """Queue one book and block until it is committed; returns its insert_books() result"""
+        self._ensure_started()
+        pending = {'data': data, 'done': threading.Event(), 'result': None}
+        self._queue.put(pending)
+        pending['done'].wait()
+        return pending['result']
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='book-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]  # Sleep until the first book arrives
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        results = None
+        try:
+            with app.app_context():
+                try:
+                    results = insert_books([pending['data'] for pending in batch], include_books=True)
+                    db.session.commit()
+                except DBAPIError:  # A write outside the writer took one of our ISBNs, or the database hiccuped
+                    db.session.rollback()
+                    results = [self._commit_one(pending['data']) for pending in batch]  # Isolate the bad one
+                mark_books_changed(*[result['id'] for result in results if result['success']])
+        except Exception:
+            app.logger.exception('Group commit failed')
+        finally:
+            if results is None:  # Our fault, not the client's: never a 400
+                results = [{'success': False, 'error': 'Could not save book', 'status': 500}] * len(batch)
+            self.batches += 1
+            self.books += len(batch)
+            for pending, result in zip(batch, results):
+                pending['result'] = result
+                pending['done'].set()  # Wake up the waiting request
+
+    def _commit_one(self, data):
+        try:
+            result = insert_books([data], include_books=True)[0]
+            db.session.commit()
+            return result
+        except IntegrityError:
+            db.session.rollback()
+            return {'success': False, 'error': 'ISBN already exists'}
+        except OperationalError:  # "database is locked" and the like - worth retrying
+            db.session.rollback()
+            app.logger.exception('Group commit of one book failed')
+            return {'success': False, 'error': 'Database is busy, please retry', 'status': 503}
+        except DBAPIError:
+            db.session.rollback()
+            app.logger.exception('Group commit of one book failed')
+            return {'success': False, 'error': 'Could not save book', 'status': 500}
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'books': self.books,
+            'queued': self._queue.qsize(),
+        }
+
+
+book_writer = BookWriter(GROUP_COMMIT_MAX_BATCH, GROUP_COMMIT_MAX_WAIT)
+
+# Group-committed creates only queue work for the writer thread, which writes
+# one batch at a time anyway. With the normal write limit (4 at once) a batch
+# could never hold more than 4 books, so they get a limit of one full batch.
+admission_limits['group_commit'] = ConcurrencyLimit(GROUP_COMMIT_MAX_BATCH, GROUP_COMMIT_MAX_BATCH, ADMISSION_MAX_WAIT)
+
+
+# =============================================================================
+# BONUS: Streaming Export
+# =============================================================================
+# jsonify() needs the whole response in memory before sending anything. For a
+# full-table dump we instead stream rows straight from a database cursor in
+# batches, so memory stays flat and the first bytes go out immediately.
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def iter_book_rows():
+    """Yield lists of book rows (plain tuples) without loading the whole table"""
+    result = db.session.execute(
+        db.select(*BOOK_COLUMNS).order_by(Book.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    yield from result.partitions()
+
+
+def generate_ndjson():
+    for batch in iter_book_rows():
+        yield b''.join(
+            json_encode(book) + b'\n'  # One JSON object per line
+            for book in rows_to_dicts(batch)
+        )
+
+
+CREATED_AT_COLUMN = BOOK_FIELDS.index('created_at')
+
+
+def csv_row(row):
+    created_at = row[CREATED_AT_COLUMN]
+    return row[:CREATED_AT_COLUMN] + (created_at.isoformat() if created_at else None,) + row[CREATED_AT_COLUMN + 1:]
+
+
+def generate_csv():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(BOOK_FIELDS)  # Header row
+    for batch in iter_book_rows():
+        writer.writerows(csv_row(row) for row in batch)  # created_at -> ISO string
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()  # Reuse the buffer for the next batch
+    if buffer.tell():
+        yield buffer.getvalue()  # Header only (empty table)
+
+
+# GET /api/books/export?format=ndjson|csv - Download the whole catalog
+@app.route('/api/books/export', methods=['GET'])
+def export_books():
+    export_format = request.args.get('format', 'ndjson')
+
+    if export_format == 'ndjson':
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+    elif export_format == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        raise ApiError("format must be 'ndjson' or 'csv'")
+
+    # stream_with_context keeps the app/db session alive while the generator runs
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=books.{export_format}'}
+    )
+
+
+# =============================================================================
+# BONUS: Full-Text Search (SQLite FTS5)
+# =============================================================================
+# LIKE '%python%' cannot use an index, so every search reads the whole table.
+# FTS5 keeps an inverted index (word -> books) in a virtual table; triggers on
+# the book table keep it in sync on every INSERT, UPDATE and DELETE.
+
+book_fts = table('book_fts', column('rowid'), column('title'), column('author'))  # Not part of db.Model metadata
+
+FTS_SETUP = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5(
+        title, author, content='book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS book_fts_insert AFTER INSERT ON book BEGIN
+        INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS book_fts_delete AFTER DELETE ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS book_fts_update AFTER UPDATE OF title, author ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO book_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END""",
+]
+
+
+def init_fts():
+    """Create the FTS5 index and its triggers (safe to run on every start)"""
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'book_fts'")
+    ).first()
+    try:
+        for statement in FTS_SETUP:
+            db.session.execute(text(statement))
+        if not exists:
+            db.session.execute(text("INSERT INTO book_fts(book_fts) VALUES ('rebuild')"))  # Index existing rows
+        db.session.commit()
+    except OperationalError:  # SQLite built without FTS5 -> keep using LIKE
+        db.session.rollback()
+        app.config['BOOK_FTS_ENABLED'] = False
+        return
+    app.config['BOOK_FTS_ENABLED'] = True
+
+
+def fts_match(column_name, value):
+    """Turn 'flask web' into 'title : "flask"* AND title : "web"*' (prefix match on every word)"""
+    words = re.findall(r'\w+', value)
+    return ' AND '.join(f'{column_name} : "{word}"*' for word in words)
+
+
 # =============================================================================
 # BONUS: Search and Filter
 # =============================================================================
 
+def parse_year(args):
+    """Read ?year=2019 into an int (None when absent)"""
+    year = args.get('year', '').strip()
+    if not year:
+        return None
+    try:
+        return int(year)
+    except ValueError:
+        raise ApiError('year must be an integer')
+
+
+def search_query(args, fields):
+    """Build the search SELECT from the query parameters (also used by async_app.py)"""
+    query = select_books(fields)
+    sort = args.get('sort')
+
+    title = args.get('q')  # Query parameter: ?q=python
+    author = args.get('author')
+
+    title_match = fts_match('title', title or '')
+    author_match = fts_match('author', author or '')
+    use_fts = app.config['BOOK_FTS_ENABLED'] and (title_match or author_match) \
+        and bool(title_match) == bool(title) and bool(author_match) == bool(author)  # Punctuation-only terms -> LIKE
+
+    if use_fts:
+        # Full-text search: indexed lookup, best matches (bm25 rank) first
+        match = ' AND '.join(part for part in (title_match, author_match) if part)
+        query = (query.join(book_fts, book_fts.c.rowid == Book.id)
+                 .filter(text('book_fts MATCH :match').bindparams(match=match)))
+        if not sort:
+            query = query.order_by(text('bm25(book_fts, 2.0, 1.0)'))  # Best matches first, title weighs double
+    else:
+        # Filter by title (partial match)
+        if title:
+            query = query.filter(Book.title.ilike(f'%{title}%'))  # Case-insensitive LIKE
+
+        # Filter by author
+        if author:
+            query = query.filter(Book.author.ilike(f'%{author}%'))
+
+    # Filter by year
+    year = parse_year(args)
+    if year is not None:
+        query = query.filter(Book.year == year)
+
+    if sort:  # ?sort=year&order=desc
+        query = sorted_by(query, *parse_sort(args))
+
+    return query
+
+
+# Most searches are the same few queries (a popular author, a recent year).
+# Each result is kept as finished JSON bytes, keyed by the normalized
+# parameters and the table version (the ETag). A write bumps the version, so
+# every older entry stops matching at once and ages out of the LRU.
+# A repeated search costs one dictionary lookup - no query, no encoding.
+
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_TTL = 300  # Seconds
+SEARCH_CACHE_MAX_BYTES = 256 * 1024  # Huge results (an empty search) are not worth the memory
+
+search_cache = LRUCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)  # (etag, params, fields) -> JSON bytes
+
+
+def normalize_search_args(args):
+    """'?q=  Python ' and '?q=python' are the same search -> same cache key"""
+    params = {}
+    for name in ('q', 'author'):
+        value = ' '.join(args.get(name, '').split()).lower()  # Both LIKE and FTS ignore case
+        if value:
+            params[name] = value
+    year = parse_year(args)
+    if year is not None:
+        params['year'] = str(year)
+    if args.get('sort'):
+        sort, descending = parse_sort(args)
+        params.update(sort=sort, order='desc' if descending else 'asc')
+    return params
+
+
 # GET /api/books/search?q=python&author=john
 @app.route('/api/books/search', methods=['GET'])
 def search_books():
-    query = Book.query
+    include = parse_include(request.args)
+    fields = fields_for_include(parse_fields(request.args), include)
+    params = normalize_search_args(request.args)
+
+    etag = include_etag(books_etag(), include)  # Read the version BEFORE querying, never after
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    mimetype = response_mimetype()
+    key = (etag, tuple(params.items()), fields, mimetype)
+    body = search_cache.get(key)
+    if body is None:
+        rows = db.session.execute(search_query(params, fields)).all()
+        body = encode_body({
+            'success': True,
+            'count': len(rows),
+            'books': embed_includes(rows_to_dicts(rows, fields), include)
+        }, mimetype)
+        if len(body) <= SEARCH_CACHE_MAX_BYTES:
+            search_cache.set(key, body)
+
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    return response
 
-    # Filter by title (partial match)
-    title = request.args.get('q')  # Query parameter: ?q=python
-    if title:
-        query = query.filter(Book.title.ilike(f'%{title}%'))  # Case-insensitive LIKE
 
-    # Filter by author
-    author = request.args.get('author')
-    if author:
-        query = query.filter(Book.author.ilike(f'%{author}%'))
+# =============================================================================
+# BONUS: Change Feed (Sync Only What Changed)
+# =============================================================================
+# A sync job that downloads all books every few minutes does work
+# proportional to the catalog, even when nothing changed. Instead, triggers
+# record every write in book_change with an ever-growing sequence number
+# (seq). A client remembers the last seq it saw and asks only for newer
+# changes. Only the latest change of each book is kept (the trigger deletes
+# the older one), and a deleted book stays as a 'delete' row (tombstone) so
+# clients learn about deletes too.
+
+class BookChange(db.Model):
+    __table_args__ = {'sqlite_autoincrement': True}  # Never reuse a seq, even after the last row is replaced
+
+    seq = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, nullable=False, unique=True)  # One row per book: its latest change
+    op = db.Column(db.String(10), nullable=False)  # 'upsert' or 'delete'
+
+
+# DELETE + INSERT instead of REPLACE: an outer INSERT ... ON CONFLICT (upsert)
+# would override the REPLACE inside the trigger and fail on the unique book_id.
+# The triggers are dropped and created again on every start, so a database
+# created with an older version of them gets the current ones.
+CHANGE_FEED_SETUP = [
+    'DROP TRIGGER IF EXISTS book_change_insert',
+    'DROP TRIGGER IF EXISTS book_change_update',
+    'DROP TRIGGER IF EXISTS book_change_delete',
+    """CREATE TRIGGER book_change_insert AFTER INSERT ON book BEGIN
+        DELETE FROM book_change WHERE book_id = new.id;
+        INSERT INTO book_change(book_id, op) VALUES (new.id, 'upsert');
+    END""",
+    """CREATE TRIGGER book_change_update AFTER UPDATE ON book BEGIN
+        DELETE FROM book_change WHERE book_id = new.id;
+        INSERT INTO book_change(book_id, op) VALUES (new.id, 'upsert');
+    END""",
+    """CREATE TRIGGER book_change_delete AFTER DELETE ON book BEGIN
+        DELETE FROM book_change WHERE book_id = old.id;
+        INSERT INTO book_change(book_id, op) VALUES (old.id, 'delete');
+    END""",
+]
+
+
+def init_change_feed():
+    """Create the change triggers; the first time, record every existing book"""
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'book_change_insert'")
+    ).first()
+    for statement in CHANGE_FEED_SETUP:
+        db.session.execute(text(statement))
+    if not exists:  # Books written before the triggers existed -> since=0 still returns the whole catalog
+        db.session.execute(text(
+            "INSERT OR IGNORE INTO book_change(book_id, op) SELECT id, 'upsert' FROM book ORDER BY id"
+        ))
+    db.session.commit()
 
-    # Filter by year
-    year = request.args.get('year')
-    if year:
-        query = query.filter_by(year=int(year))
 
-    books = query.all()
+def load_changes(since, limit):
+    """Up to `limit` changes after seq `since`, oldest first, with the current book for upserts"""
+    rows = db.session.execute(
+        db.select(BookChange.seq, BookChange.op, BookChange.book_id, *BOOK_COLUMNS)
+        .outerjoin(Book, Book.id == BookChange.book_id)
+        .where(BookChange.seq > since)
+        .order_by(BookChange.seq)
+        .limit(limit)
+    ).all()
+    return [{
+        'seq': row.seq,
+        'op': row.op,
+        'id': row.book_id,
+        'book': dict(zip(BOOK_FIELDS, row[3:])) if row.op == 'upsert' else None
+    } for row in rows]
+
+
+# GET /api/books/changes?since=0&limit=100 - Changes after seq `since`, oldest first
+@app.route('/api/books/changes', methods=['GET'])
+def get_book_changes():
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        raise ApiError('since must be an integer')
+    limit = parse_limit(request.args.get('limit', MAX_PAGE_SIZE))
+
+    changes = load_changes(since, limit + 1)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
 
     return jsonify({
         'success': True,
-        'count': len(books),
-        'books': [book.to_dict() for book in books]
+        'count': len(changes),
+        'changes': changes,
+        'next_since': changes[-1]['seq'] if changes else since,  # Send this as ?since= next time
+        'has_more': has_more
+    })
+
+
+# =============================================================================
+# BONUS: Live Updates (Server-Sent Events)
+# =============================================================================
+# Browsers that poll /api/books every few seconds download the same list
+# again and again. With Server-Sent Events a browser keeps one HTTP response
+# open and the server writes a line whenever a book changes:
+#     const events = new EventSource('/api/books/events');
+#     events.addEventListener('upsert', e => console.log(JSON.parse(e.data)));
+# After each write, one broadcaster reads the new book_change rows ONCE and
+# keeps them (already formatted) in a small ring buffer; every open stream
+# copies them from there. Event ids are change seqs, so a browser that
+# reconnects sends Last-Event-ID and gets what it missed from the change feed.
+# Each open stream holds one server thread that sleeps until something
+# happens, so idle browsers cost no queries.
+
+SSE_BUFFER_SIZE = 1000  # Recent events kept in memory for fan-out
+SSE_HEARTBEAT = 15  # Seconds between keep-alive comments (proxies close silent connections)
+SSE_MAX_CLIENTS = 500  # Every open stream holds one server thread
+SSE_RETRY_MS = 3000  # How long a browser waits before reconnecting
+
+
+def format_event(change):
+    return f'id: {change["seq"]}\nevent: {change["op"]}\ndata: '.encode() + json_encode(change) + b'\n\n'
+
+
+class BookEventBroadcaster:
+    """Loads each new change once and hands it to every open event stream"""
+
+    def __init__(self, buffer_size):
+        self._events = deque(maxlen=buffer_size)  # (seq, formatted event), oldest first
+        self._floor = 0  # Changes after this seq are all in _events
+        self.last_seq = None  # Newest change loaded; None = nobody listening, nothing loaded
+        self._condition = threading.Condition()
+        self.clients = 0
+
+    def subscribe(self):
+        """Register a stream; return the seq it starts after, or None when full"""
+        with self._condition:
+            if self.clients >= SSE_MAX_CLIENTS:
+                return None
+            if self.last_seq is None:
+                self.last_seq = self._floor = db.session.scalar(db.select(func.coalesce(func.max(BookChange.seq), 0)))
+            self.clients += 1
+            return self.last_seq
+
+    def unsubscribe(self):
+        with self._condition:
+            self.clients -= 1
+
+    def publish(self):
+        """Call after a commit: load the new changes and wake the streams"""
+        with self._condition:
+            if not self.clients:  # Don't read changes nobody will receive
+                self._events.clear()
+                self.last_seq = None
+                return
+            while True:
+                changes = load_changes(self.last_seq, SSE_BUFFER_SIZE)
+                for change in changes:
+                    if len(self._events) == self._events.maxlen:
+                        self._floor = self._events[0][0]  # About to drop the oldest event
+                    self._events.append((change['seq'], format_event(change)))
+                    self.last_seq = change['seq']
+                if len(changes) < SSE_BUFFER_SIZE:
+                    break
+            self._condition.notify_all()
+
+    def wait(self, after_seq, timeout):
+        """Events after after_seq; [] on timeout; None if they already left the buffer"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.last_seq is not None and self.last_seq > after_seq, timeout)
+            if after_seq < self._floor:
+                return None
+            return [(seq, event) for seq, event in self._events if seq > after_seq]
+
+
+book_events = BookEventBroadcaster(SSE_BUFFER_SIZE)
+
+
+def replay_changes(since, until):
+    """Formatted events for changes after `since` up to `until`, read from the change feed"""
+    while since < until:
+        with app.app_context():  # Short session: don't keep a read transaction open for hours
+            changes = load_changes(since, MAX_PAGE_SIZE)
+        changes = [change for change in changes if change['seq'] <= until]
+        if not changes:
+            return
+        for change in changes:
+            yield change['seq'], format_event(change)
+        since = changes[-1]['seq']
+
+
+# GET /api/books/events - Stream of book changes (text/event-stream)
+@app.route('/api/books/events', methods=['GET'])
+def book_event_stream():
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('since'))
+    try:
+        resume_from = int(last_event_id) if last_event_id else None
+    except ValueError:
+        raise ApiError('Last-Event-ID must be an integer')
+
+    start = book_events.subscribe()
+    if start is None:
+        raise ApiError('Too many open event streams, please poll instead', 503)
+
+    closed = []
+
+    def close():
+        if not closed:
+            closed.append(True)
+            book_events.unsubscribe()
+
+    def stream():
+        last_seq = start if resume_from is None else min(resume_from, start)
+        try:
+            yield f'retry: {SSE_RETRY_MS}\n\n'.encode()
+            while True:
+                events = book_events.wait(last_seq, SSE_HEARTBEAT)
+                if events is None:  # Fell behind the buffer -> catch up from the database
+                    events = replay_changes(last_seq, book_events.last_seq)
+                elif not events:
+                    yield b': keep-alive\n\n'
+                for seq, event in events:
+                    yield event
+                    last_seq = seq
+        finally:
+            close()  # Browser closed the tab (noticed at the next write or keep-alive)
+
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Tell nginx not to buffer the stream
     })
+    response.call_on_close(close)  # Also when the stream is closed before it started
+    return response
 
 
 # =============================================================================
@@ -263,16 +2462,32 @@ def index():
 # Get all books
 curl http://localhost:5000/api/books
 
+# Get books one page at a time (pass next_cursor back as ?after=)
+curl "http://localhost:5000/api/books?limit=2"
+
+# Export the whole catalog (streams, works for any table size)
+curl "http://localhost:5000/api/books/export?format=csv"
+
 # Create a book
 curl -X POST http://localhost:5000/api/books \\
   -H "Content-Type: application/json" \\
   -d '{"title": "Flask Web Development", "author": "Miguel Grinberg", "year": 2018}'
 
+# Create many books in one request
+curl -X POST http://localhost:5000/api/books/bulk \\
+  -H "Content-Type: application/json" \\
+  -d '[{"title": "Book A", "author": "Ann"}, {"title": "Book B", "author": "Bob"}]'
+
 # Update a book
 curl -X PUT http://localhost:5000/api/books/1 \\
   -H "Content-Type: application/json" \\
   -d '{"year": 2023}'
 
+# Update only some fields (one UPDATE statement)
+curl -X PATCH http://localhost:5000/api/books/1 \\
+  -H "Content-Type: application/json" \\
+  -d '{"year": 2024}'
+
 # Delete a book
 curl -X DELETE http://localhost:5000/api/books/1
         </pre>
@@ -285,9 +2500,19 @@ curl -X DELETE http://localhost:5000/api/books/1
 # INITIALIZE DATABASE WITH SAMPLE DATA
 # =============================================================================
 
+def create_schema():
+    """Tables, indexes, full-text index and change triggers (safe to run on every start)"""
+    db.create_all()
+    init_authors()  # Before the indexes: ix_book_author_id needs the author_id column
+    for index in Book.__table__.indexes:  # create_all() skips indexes of tables that already exist
+        index.create(db.engine, checkfirst=True)
+    init_fts()
+    init_change_feed()
+
+
 def init_db():
     with app.app_context():
-        db.create_all()
+        create_schema()
 
         if Book.query.count() == 0:
             sample_books = [
@@ -299,6 +2524,8 @@ def init_db():
             db.session.commit()
             print('Sample books added!')
 
+        autocomplete_index.build()
+
 
 if __name__ == '__main__':
     init_db()
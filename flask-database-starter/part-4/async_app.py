@@ -0,0 +1,289 @@
+"""
+Part 4 (Bonus): Async REST API with Quart
+=========================================
+The same Book API as app.py, but every view is `async def` and talks to the
+database through SQLAlchemy's AsyncSession (aiosqlite driver). While one
+request waits for the database, the event loop serves the others, so many
+small concurrent calls no longer need one worker thread each.
+
+What You'll Learn:
+- WSGI (one thread per request) vs ASGI (one event loop, many requests)
+- async / await views with Quart (Flask's async twin - same API)
+- AsyncSession and async_sessionmaker
+
+Prerequisites: Part 4 app.py (this file reuses its model and helpers)
+Install: pip install quart aiosqlite uvicorn "sqlalchemy[asyncio]"
+Run: uvicorn async_app:app      (or: python async_app.py)
+"""
+
+from quart import Quart, request, jsonify
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import app as sync_app  # The Flask app: model, database file and shared helpers
+from app import (
+    AUTHOR_EMBED_FIELDS, ApiError, Author, Book, FastJSONProvider, MAX_PAGE_SIZE, MULTI_GET_CHUNK_SIZE, after_row,
+    book_data_error, book_field_error, decode_cursor, encode_cursor, fields_for_include, parse_fields, parse_ids,
+    parse_include, parse_limit, parse_sort, rows_to_dicts, search_query, select_books, sorted_by,
+)
+
+app = Quart(__name__)
+app.json = FastJSONProvider(app)  # Same fast JSON as the Flask app
+
+with sync_app.app.app_context():
+    DATABASE_URL = sync_app.db.engine.url.set(drivername='sqlite+aiosqlite')  # Same database file as app.py
+
+engine = create_async_engine(DATABASE_URL)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+@app.before_serving
+async def setup():
+    sync_app.init_db()  # Tables, indexes and full-text search index (runs once at startup)
+
+
+@app.errorhandler(ApiError)
+async def handle_api_error(error):
+    return jsonify({'success': False, 'error': error.message}), error.status
+
+
+async def keyset_page(session, stmt, limit, after=None, sort='id', descending=False):
+    """Async version of app.keyset_page()"""
+    cursor_key = f'-{sort}' if descending else sort
+    stmt = sorted_by(stmt, sort, descending)
+
+    if after:
+        value, last_id = decode_cursor(after, cursor_key)
+        rows = []
+        for clause in after_row(sort, descending, value, last_id):
+            rows += (await session.execute(stmt.where(clause).limit(limit + 1 - len(rows)))).all()
+            if len(rows) > limit:
+                break
+    else:
+        rows = (await session.execute(stmt.limit(limit + 1))).all()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(cursor_key, getattr(last, sort), last.id)
+
+
+async def embed_includes(session, books, include):
+    """Async version of app.embed_includes()"""
+    if 'author' not in include:
+        return books
+
+    author_ids = list({book['author_id'] for book in books if book['author_id'] is not None})
+    authors = {}
+    for start in range(0, len(author_ids), MULTI_GET_CHUNK_SIZE):
+        chunk = author_ids[start:start + MULTI_GET_CHUNK_SIZE]
+        columns = [getattr(Author, field) for field in AUTHOR_EMBED_FIELDS]
+        for row in await session.execute(select(*columns).where(Author.id.in_(chunk))):
+            authors[row.id] = dict(zip(AUTHOR_EMBED_FIELDS, row))
+
+    return [dict(book, author_details=authors.get(book['author_id'])) for book in books]
+
+
+async def check_author_id(session, author_id):
+    """Async version of app.check_author_id()"""
+    if author_id is None:
+        return None
+    if not isinstance(author_id, int) or isinstance(author_id, bool):
+        raise ApiError('author_id must be an integer')
+    if not await session.scalar(select(Author.id).where(Author.id == author_id)):
+        raise ApiError('Author not found')
+    return author_id
+
+
+# =============================================================================
+# REST API ROUTES (same URLs and JSON as app.py)
+# =============================================================================
+
+# GET /api/books - Get all books (supports limit/after, sort/order, fields, ids, include)
+@app.route('/api/books', methods=['GET'])
+async def get_books():
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    include = parse_include(request.args)
+    fields = fields_for_include(parse_fields(request.args), include)
+    sort, descending = parse_sort(request.args)
+
+    async with Session() as session:
+        if request.args.get('ids') is not None:
+            ids = parse_ids(request.args['ids'])
+            found = {}
+            for start in range(0, len(ids), MULTI_GET_CHUNK_SIZE):
+                chunk = ids[start:start + MULTI_GET_CHUNK_SIZE]
+                for row in await session.execute(select_books(fields).where(Book.id.in_(chunk))):
+                    found[row.id] = dict(zip(fields, row))
+            return jsonify({
+                'success': True,
+                'count': len(found),
+                'books': await embed_includes(session, [found[book_id] for book_id in ids if book_id in found], include),
+                'missing': [book_id for book_id in ids if book_id not in found]
+            })
+
+        if limit is None and after is None:
+            rows = (await session.execute(sorted_by(select_books(fields, sort), sort, descending))).all()
+            return jsonify({
+                'success': True,
+                'count': len(rows),
+                'books': await embed_includes(session, rows_to_dicts(rows, fields), include)
+            })
+
+        rows, next_cursor = await keyset_page(
+            session, select_books(fields, sort), parse_limit(limit or MAX_PAGE_SIZE), after, sort, descending
+        )
+        books = await embed_includes(session, rows_to_dicts(rows, fields), include)
+    return jsonify({
+        'success': True,
+        'count': len(rows),
+        'books': books,
+        'next_cursor': next_cursor
+    })
+
+
+# GET /api/books/<id> - Get single book
+@app.route('/api/books/<int:id>', methods=['GET'])
+async def get_book(id):
+    include = parse_include(request.args)
+    fields = fields_for_include(parse_fields(request.args), include)
+
+    async with Session() as session:
+        row = (await session.execute(select_books(fields).where(Book.id == id))).first()
+
+        if not row:
+            return jsonify({'success': False, 'error': 'Book not found'}), 404
+
+        book = (await embed_includes(session, rows_to_dicts([row], fields), include))[0]
+
+    return jsonify({
+        'success': True,
+        'book': book
+    })
+
+
+# POST /api/books - Create new book
+@app.route('/api/books', methods=['POST'])
+async def create_book():
+    data = await request.get_json()
+
+    error = book_data_error(data)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    async with Session() as session:
+        if data.get('isbn'):
+            existing = await session.scalar(select(Book.id).where(Book.isbn == data['isbn']).limit(1))
+            if existing:
+                return jsonify({'success': False, 'error': 'ISBN already exists'}), 400
+
+        new_book = Book(
+            title=data['title'],
+            author=data['author'],
+            year=data.get('year'),
+            isbn=data.get('isbn'),
+            author_id=await check_author_id(session, data.get('author_id'))
+        )
+        session.add(new_book)
+        await session.commit()  # Waits for SQLite without blocking other requests
+
+    return jsonify({
+        'success': True,
+        'message': 'Book created successfully',
+        'book': new_book.to_dict()
+    }), 201
+
+
+# PUT /api/books/<id> - Update book
+@app.route('/api/books/<int:id>', methods=['PUT'])
+async def update_book(id):
+    async with Session() as session:
+        book = await session.get(Book, id)
+
+        if not book:
+            return jsonify({'success': False, 'error': 'Book not found'}), 404
+
+        data = await request.get_json()
+
+        if not data:
+            return jsonify({'success': False, 'error': 'No data provided'}), 400
+
+        for field in ('title', 'author', 'year', 'isbn', 'author_id'):
+            error = book_field_error(field, data[field]) if field in data else None
+            if error:
+                return jsonify({'success': False, 'error': error}), 400
+
+        for field in ('title', 'author', 'year', 'isbn'):
+            if field in data:
+                setattr(book, field, data[field])
+        if 'author_id' in data:
+            book.author_id = await check_author_id(session, data['author_id'])
+
+        await session.commit()
+
+    return jsonify({
+        'success': True,
+        'message': 'Book updated successfully',
+        'book': book.to_dict()
+    })
+
+
+# DELETE /api/books/<id> - Delete book
+@app.route('/api/books/<int:id>', methods=['DELETE'])
+async def delete_book(id):
+    async with Session() as session:
+        book = await session.get(Book, id)
+
+        if not book:
+            return jsonify({'success': False, 'error': 'Book not found'}), 404
+
+        await session.delete(book)
+        await session.commit()
+
+    return jsonify({
+        'success': True,
+        'message': 'Book deleted successfully'
+    })
+
+
+# GET /api/books/search?q=python&author=john
+@app.route('/api/books/search', methods=['GET'])
+async def search_books():
+    include = parse_include(request.args)
+    fields = fields_for_include(parse_fields(request.args), include)
+
+    async with Session() as session:
+        rows = (await session.execute(search_query(request.args, fields))).all()
+        books = await embed_includes(session, rows_to_dicts(rows, fields), include)
+
+    return jsonify({
+        'success': True,
+        'count': len(rows),
+        'books': books
+    })
+
+
+if __name__ == '__main__':
+    app.run(debug=True)
+
+
+# =============================================================================
+# SYNC (app.py) vs ASYNC (this file):
+# =============================================================================
+#
+# app.py (Flask, WSGI)              | async_app.py (Quart, ASGI)
+# ----------------------------------|-----------------------------------------
+# def get_book(id):                 | async def get_book(id):
+# db.session.execute(...)           | await session.execute(...)
+# Book.query.get(id)                | await session.get(Book, id)
+# db.session.commit()               | await session.commit()
+# request.get_json()                | await request.get_json()
+# python app.py                     | uvicorn async_app:app
+#
+# ETags, caches and the other extras in app.py keep their state inside the
+# Flask process, so they are not repeated here.
+#
+# =============================================================================
@@ -0,0 +1,67 @@
+"""
+Part 4 (Bonus): Check that sorting uses the indexes
+===================================================
+Asks SQLite how it would run every sorted list query of app.py (EXPLAIN
+QUERY PLAN) without running them. A plan that says "USE TEMP B-TREE FOR
+ORDER BY" means SQLite would read all matching rows and sort them itself -
+fine for 10 books, slow for a million. With the right indexes every plan
+is a SEARCH or SCAN "USING INDEX" instead.
+
+Run: python check_query_plans.py
+Exits with status 1 (and prints the bad plans) if any query sorts on its own.
+"""
+
+import sys
+
+from app import (
+    BOOK_FIELDS, SORT_COLUMNS, Book, after_row, app, create_schema, db, search_query, select_books, sorted_by,
+)
+
+PAGE_SIZE = 20
+SAMPLE_VALUES = {'id': 1, 'title': 'Flask Web Development', 'author': 'Miguel Grinberg', 'year': 2018}
+
+
+def list_queries():
+    """(name, select) for the first page and every kind of "next page" query"""
+    for sort in SORT_COLUMNS:
+        for descending in (False, True):
+            name = f'sort={sort}&order={"desc" if descending else "asc"}'
+            stmt = sorted_by(select_books(BOOK_FIELDS, sort), sort, descending)
+            yield name, stmt.limit(PAGE_SIZE + 1)
+
+            cursors = [SAMPLE_VALUES[sort]]
+            if sort != 'id' and getattr(Book, sort).nullable:
+                cursors.append(None)  # Cursor inside the block of NULL values
+            for value in cursors:
+                for clause in after_row(sort, descending, value, 1):
+                    yield f'{name}&after=({value!r}, 1)', stmt.where(clause).limit(PAGE_SIZE + 1)
+
+    yield 'search?year=2018', search_query({'year': '2018'}, BOOK_FIELDS)
+    yield 'search?year=2018&sort=id', search_query({'year': '2018', 'sort': 'id'}, BOOK_FIELDS)
+
+
+def query_plan(stmt):
+    sql = stmt.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')).all()
+    return [row[-1] for row in rows]  # Last column is the human-readable step
+
+
+def main():
+    failed = 0
+    with app.app_context():
+        create_schema()  # Tables and indexes, like the app does at startup
+        for name, stmt in list_queries():
+            plan = query_plan(stmt)
+            ok = not any('TEMP B-TREE' in step for step in plan)
+            print(f'{"ok  " if ok else "SORT"}  {name:55} {" | ".join(plan)}')
+            failed += not ok
+
+    if failed:
+        print(f'\n{failed} queries sort without an index')
+        return 1
+    print('\nEvery query reads rows in index order')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())